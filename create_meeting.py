@@ -9,12 +9,23 @@ Author: Taylor Hanson, Cisco Collab SE
 Purpose: Teaching tool and example for Webex API integration
 """
 
+import hashlib
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import orjson
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util import Retry
+from typing import Dict, Any, List, Optional, Tuple
 
 # Python dependencies, Install with:
-# pip install requests>=2.31.0
+# pip install requests>=2.31.0 urllib3>=1.26 orjson>=3.9.0
 
 # ============================================================================
 # CONFIGURATION SECTION - Modify these values as needed
@@ -44,6 +55,190 @@ SITE_URL = ""
 
 # API Base URL - shouldn't need to change this
 WEBEX_API_BASE = "https://webexapis.com/v1"
+# Maximum number of meetings created at the same time by create_meetings()
+# (kept low so bulk scheduling stays within the Webex API rate limits)
+MAX_CONCURRENT_REQUESTS = 5
+# Access tokens are cached here between runs (keyed by a hash of the credentials) so the script
+# only has to refresh the token when the cached one is about to expire
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "webex_token.json")
+# Access token already obtained by this process (filled in by get_access_token)
+CACHED_TOKEN: Dict[str, Any] = {}
+# Makes sure only one call at a time replaces a rejected access token
+TOKEN_LOCK = threading.Lock()
+# Headers shared by every JSON request body (the access token is added per call)
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Meeting fields shown by display_meeting_details(), with "N/A" for any that are missing
+MEETING_FIELD_DEFAULTS = dict.fromkeys(
+    ("title", "id", "meetingNumber", "password", "start", "end", "timezone",
+     "hostEmail", "siteUrl", "webLink", "sipAddress"),
+    "N/A"
+)
+MEETING_DETAILS_TEMPLATE = (
+    "=" * 70 + "\n"
+    "MEETING DETAILS\n"
+    + "=" * 70 + "\n"
+    "\nTitle:         {title}\n"
+    "Meeting ID:    {id}\n"
+    "Meeting Number:{meetingNumber}\n"
+    "Password:      {password}\n"
+    "Start Time:    {start}\n"
+    "End Time:      {end}\n"
+    "Timezone:      {timezone}\n"
+    "Host Email:    {hostEmail}\n"
+    "Site URL:      {siteUrl}\n"
+    "Web Link:      {webLink}\n"
+    "SIP Address:   {sipAddress}\n"
+    "\n" + "=" * 70 + "\n"
+)
+
+
+class WebexRetry(Retry):
+    """
+    Retry policy that never repeats a POST which Webex may already have processed.
+    A 500/502/504 reply to "create meeting" or "create report" can arrive after the
+    object was created, so retrying it could create a duplicate. Those POSTs are
+    only retried when Webex says it didn't process them: 429 (rate limited), or
+    503 with a Retry-After header, or when the connection couldn't be opened.
+    Exchanging the refresh token is safe to repeat, so it gets the full policy.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if (method or "").upper() == "POST" and not (url or "").endswith("/access_token"):
+            if error is not None and not self._is_connection_error(error):
+                # The request may have reached Webex - report the error instead
+                raise error.with_traceback(_stacktrace)
+            if response is not None and not (
+                response.status == 429
+                or (response.status == 503 and response.headers.get("Retry-After"))
+            ):
+                # Hand the response back as-is (see raise_on_status below)
+                raise MaxRetryError(_pool, url, ResponseError(f"not retrying POST after {response.status}"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+# Retry policy for transient failures - Webex rate limits every endpoint (429)
+# and asks clients to wait for the Retry-After header before trying again.
+# Other 5xx errors get exponential backoff (1s, 2s, 4s, ...) before giving up.
+RETRY_POLICY = WebexRetry(
+    total=8,
+    backoff_factor=1.0,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods={"GET", "POST"},  # WebexRetry.increment() limits which POSTs are retried
+    respect_retry_after_header=True,
+    raise_on_status=False  # Hand the last response back so raise_for_status() reports it
+)
+
+# Shared HTTP session - reusing one session keeps the TCP/TLS connection to
+# Webex open between calls instead of doing a fresh handshake for every request
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(max_retries=RETRY_POLICY, pool_connections=10, pool_maxsize=10))
+
+
+def read_cache_file(path: str) -> Dict[str, Any]:
+    """
+    Read a JSON cache file from disk.
+    Args:
+        path: Location of the cache file
+    Returns:
+        Dictionary stored in the cache (empty if there is no cache yet)
+    """
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+
+def write_cache_file(path: str, cache: Dict[str, Any]) -> None:
+    """
+    Write a JSON cache file to disk.
+    The file is only readable by the current user since caches can hold credentials.
+    Args:
+        path: Location of the cache file
+        cache: Dictionary to store in the cache
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Create the file with owner-only permissions, and tighten them on an existing file
+        with open(path, "wb", opener=lambda name, flags: os.open(name, flags, 0o600)) as f:
+            f.write(orjson.dumps(cache))
+        os.chmod(path, 0o600)
+    except OSError as e:
+        # Caching is only an optimization - carry on without it
+        print(f"WARNING: Could not update cache file {path}: {e}")
+
+
+def token_cache_key() -> str:
+    """
+    Build the token cache key from the configured credentials, so changing
+    CLIENT_ID, CLIENT_SECRET or REFRESH_TOKEN (e.g. to act as a different user)
+    never picks up a token cached for the old ones. Only a hash is stored, never
+    the credentials themselves.
+    Returns:
+        Hex SHA-256 digest of the credentials
+    """
+    credentials = "\0".join((CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN))
+    return hashlib.sha256(credentials.encode("utf-8")).hexdigest()
+
+
+def forget_cached_token() -> None:
+    """
+    Drop the access token from both the in-process and the on-disk cache.
+    """
+    CACHED_TOKEN.clear()
+    cache = read_cache_file(TOKEN_CACHE_FILE)
+    if cache.pop(token_cache_key(), None) is not None:
+        write_cache_file(TOKEN_CACHE_FILE, cache)
+
+
+def refresh_token_on_401(response: requests.Response, *args, **kwargs) -> requests.Response:
+    """
+    Session response hook: when Webex rejects an access token (e.g. a cached token
+    that was revoked), get a new one and send the request again once.
+    Args:
+        response: The HTTP response returned by the session
+        kwargs: Send options (stream, timeout, ...) to reuse for the retried request
+    Returns:
+        The original response, or the response to the retried request
+    """
+    rejected = response.request.headers.get("Authorization")
+    # The token exchange itself has no bearer token - a 401 there is a real error
+    if response.status_code != 401 or not rejected:
+        return response
+    with TOKEN_LOCK:
+        if CACHED_TOKEN and f"Bearer {CACHED_TOKEN['access_token']}" != rejected:
+            # Another call already replaced the rejected token
+            access_token = CACHED_TOKEN["access_token"]
+        else:
+            print("⚠️  Access token was rejected - requesting a new one...")
+            forget_cached_token()
+            access_token = get_access_token()
+    response.close()
+    request = response.request.copy()
+    request.headers["Authorization"] = f"Bearer {access_token}"
+    # Send through the adapter directly so this hook can't run again for the retry
+    return response.connection.send(request, **kwargs)
+
+
+SESSION.hooks["response"].append(refresh_token_on_401)
+
+
+class CurrentTokenAuth(AuthBase):
+    """
+    Session auth: send every Webex API call with the current access token, so a
+    caller still holding a token that refresh_token_on_401() has since replaced
+    doesn't get a 401 (and a resend) on every following request.
+    """
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        # The token exchange has no bearer token and is left untouched
+        if CACHED_TOKEN and "Authorization" in request.headers:
+            request.headers["Authorization"] = f"Bearer {CACHED_TOKEN['access_token']}"
+        return request
+
+
+SESSION.auth = CurrentTokenAuth()
 
 
 def get_access_token() -> str:
@@ -51,12 +246,24 @@ def get_access_token() -> str:
     Exchange a refresh token for a new access token.
     The access token is temporary and used for API calls during this session.
     OAuth flow: refresh_token -> access_token
+    A token obtained earlier in this process, or cached on disk by a previous run,
+    is reused if it is still valid for at least a minute - so calling this
+    repeatedly (e.g. when the script is imported as a module) is cheap.
     Returns:
         A valid access token string
     Raises:
         SystemExit: If token refresh fails
     """
+    # Token already obtained earlier in this process - nothing to do
+    if CACHED_TOKEN and time.time() < CACHED_TOKEN["expires_at"] - 60:
+        return CACHED_TOKEN["access_token"]
     print("🔐 Authenticating with Webex...")
+    # Reuse the token cached on disk by a previous run if it isn't about to expire
+    cached = read_cache_file(TOKEN_CACHE_FILE).get(token_cache_key())
+    if cached and time.time() < cached.get("expires_at", 0) - 60:
+        CACHED_TOKEN.update(cached)
+        print("✓ Using cached access token\n")
+        return cached["access_token"]
     # Prepare the token request
     url = f"{WEBEX_API_BASE}/access_token"
     headers = {"content-type": "application/x-www-form-urlencoded"}
@@ -68,17 +275,26 @@ def get_access_token() -> str:
     }
     # Make the POST request to get a new access token
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = SESSION.post(url, headers=headers, data=data)
         response.raise_for_status()  # Raise an error for bad status codes (4xx, 5xx)
         # Extract the access token from the response
-        token_data = response.json()
+        token_data = orjson.loads(response.content)
         access_token = token_data.get("access_token")
         if not access_token:
             print("ERROR: No access token in response")
             sys.exit(1)
+        # Cache the token for this process and later runs - Webex access tokens are valid for
+        # 14 days unless the response says otherwise
+        CACHED_TOKEN.update({
+            "access_token": access_token,
+            "expires_at": time.time() + token_data.get("expires_in", 1209600)
+        })
+        cache = read_cache_file(TOKEN_CACHE_FILE)
+        cache[token_cache_key()] = dict(CACHED_TOKEN)
+        write_cache_file(TOKEN_CACHE_FILE, cache)
         print("✓ Authentication successful!\n")
         return access_token
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"ERROR: Failed to get access token: {e}")
         sys.exit(1)
 
@@ -87,6 +303,8 @@ def create_meeting(access_token: str, title: str, start: str, end: str,
                    timezone: str, host_email: str, site_url: str) -> Dict[str, Any]:
     """
     Create a new Webex meeting with the specified parameters.
+    Progress is reported by the caller (see create_meetings), so this can run
+    on several threads at once without interleaving its output.
     Args:
         access_token: Valid Webex access token
         title: Meeting title/subject
@@ -100,19 +318,9 @@ def create_meeting(access_token: str, title: str, start: str, end: str,
     Raises:
         SystemExit: If meeting creation fails
     """
-    print("📅 Creating Webex meeting...")
-    print(f"   Title: {title}")
-    print(f"   Start: {start}")
-    print(f"   End: {end}")
-    print(f"   Timezone: {timezone}")
-    print(f"   Host: {host_email}")
-    print(f"   Site: {site_url}\n")
     # Prepare the API request
     url = f"{WEBEX_API_BASE}/meetings"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    headers = {**JSON_HEADERS, "Authorization": f"Bearer {access_token}"}
     # Prepare the request payload
     payload = {
         "title": title,
@@ -125,41 +333,111 @@ def create_meeting(access_token: str, title: str, start: str, end: str,
     }
     # Make the POST request to create the meeting
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = SESSION.post(url, headers=headers, data=orjson.dumps(payload))
         response.raise_for_status()
         # Parse the meeting details from the response
-        meeting_data = response.json()
-        print("✓ Meeting created successfully!\n")
+        meeting_data = orjson.loads(response.content)
         return meeting_data
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR: Failed to create meeting: {e}")
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        # Print the error as a single line so it stays readable when several
+        # meetings are being created at the same time
+        message = f"ERROR: Failed to create meeting '{title}': {e}"
         if hasattr(e, 'response') and e.response is not None:
-            print(f"Response: {e.response.text}")
+            message += f"\nResponse: {e.response.text}"
+        print(message)
         sys.exit(1)
 
 
+def create_meetings(access_token: str,
+                    specs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Create several Webex meetings concurrently (e.g. a term's worth of classes).
+    Up to MAX_CONCURRENT_REQUESTS meetings are created at a time, all sharing the
+    same HTTP session so the connections to Webex are reused.
+    A failed meeting doesn't stop the others - every meeting that was created is
+    still returned, so nothing is created on the server without being reported.
+    Args:
+        access_token: Valid Webex access token
+        specs: List of dictionaries with the create_meeting() arguments for each
+               meeting (title, start, end, timezone, host_email, site_url)
+    Returns:
+        Tuple of (created meeting details, specs that failed), each in the same
+        order as specs
+    """
+    print(f"📅 Creating {len(specs)} Webex meeting(s)...")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(specs)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        futures = {
+            executor.submit(create_meeting, access_token, **spec): index
+            for index, spec in enumerate(specs)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            spec = specs[index]
+            summary = (f"{spec['title']} ({spec['start']} to {spec['end']}, {spec['timezone']}) "
+                       f"- host {spec['host_email']} on {spec['site_url']}")
+            try:
+                results[index] = future.result()
+            except SystemExit:
+                # create_meeting() already printed the error for this meeting
+                print(f"   ❌ {summary}")
+                continue
+            except Exception as e:
+                print(f"   ❌ {summary}: unexpected error: {e}")
+                continue
+            print(f"   ✓ {summary}")
+    created = [meeting for meeting in results if meeting is not None]
+    failed = [spec for spec, meeting in zip(specs, results) if meeting is None]
+    print(f"✓ Created {len(created)} of {len(specs)} meeting(s)\n")
+    return created, failed
+
+
 def display_meeting_details(meeting: Dict[str, Any]) -> None:
     """
     Display meeting details in a user-friendly format.
     Args:
         meeting: Dictionary containing meeting details from Webex API
     """
-    print("=" * 70)
-    print("MEETING DETAILS")
-    print("=" * 70)
-    # Extract and display relevant fields
-    print(f"\nTitle:         {meeting.get('title', 'N/A')}")
-    print(f"Meeting ID:    {meeting.get('id', 'N/A')}")
-    print(f"Meeting Number:{meeting.get('meetingNumber', 'N/A')}")
-    print(f"Password:      {meeting.get('password', 'N/A')}")
-    print(f"Start Time:    {meeting.get('start', 'N/A')}")
-    print(f"End Time:      {meeting.get('end', 'N/A')}")
-    print(f"Timezone:      {meeting.get('timezone', 'N/A')}")
-    print(f"Host Email:    {meeting.get('hostEmail', 'N/A')}")
-    print(f"Site URL:      {meeting.get('siteUrl', 'N/A')}")
-    print(f"Web Link:      {meeting.get('webLink', 'N/A')}")
-    print(f"SIP Address:   {meeting.get('sipAddress', 'N/A')}")
-    print("\n" + "=" * 70)
+    # Fill in the template in one go and write it with a single call
+    view = {**MEETING_FIELD_DEFAULTS, **meeting}
+    sys.stdout.write(MEETING_DETAILS_TEMPLATE.format_map(view))
+
+
+def validate_config() -> None:
+    """
+    Check the configuration values before making any API calls, so a missing
+    credential or a typo in the meeting times fails immediately with a clear
+    message instead of an error from Webex after a network round-trip.
+    Raises:
+        SystemExit: If any configuration value is missing or invalid
+    """
+    required = {
+        "CLIENT_ID": CLIENT_ID,
+        "CLIENT_SECRET": CLIENT_SECRET,
+        "REFRESH_TOKEN": REFRESH_TOKEN,
+        "HOST_EMAIL": HOST_EMAIL,
+        "SITE_URL": SITE_URL
+    }
+    missing = [name for name, value in required.items() if not value]
+    if missing:
+        print(f"ERROR: Please set {', '.join(missing)} in the CONFIGURATION SECTION")
+        sys.exit(1)
+    # Meeting times must be ISO 8601 with a timezone offset, and start before they end.
+    # Python < 3.11 can't parse a trailing "Z" (UTC), so spell it out as +00:00 first.
+    try:
+        start, end = (
+            datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+            for value in (MEETING_START, MEETING_END)
+        )
+    except ValueError as e:
+        print(f"ERROR: MEETING_START/MEETING_END must be in YYYY-MM-DDTHH:MM:SS±HH:MM format ({e})")
+        sys.exit(1)
+    if start.tzinfo is None or end.tzinfo is None:
+        print("ERROR: MEETING_START and MEETING_END must both include a timezone offset (e.g. +03:00 or Z)")
+        sys.exit(1)
+    if start >= end:
+        print(f"ERROR: MEETING_START ({MEETING_START}) must be before MEETING_END ({MEETING_END})")
+        sys.exit(1)
 
 
 def main():
@@ -170,20 +448,30 @@ def main():
     print("WEBEX MEETING CREATOR")
     print("=" * 70 + "\n")
     
+    # Step 0: Check the configuration before talking to Webex
+    validate_config()
     # Step 1: Authenticate with Webex
     access_token = get_access_token()
     # Step 2: Create the meeting with configured parameters
-    meeting_details = create_meeting(
-        access_token=access_token,
-        title=MEETING_TITLE,
-        start=MEETING_START,
-        end=MEETING_END,
-        timezone=MEETING_TIMEZONE,
-        host_email=HOST_EMAIL,
-        site_url=SITE_URL
-    )
-    # Step 3: Display the meeting details
-    display_meeting_details(meeting_details)
+    # (add more entries to this list to schedule several meetings at once)
+    meeting_specs = [
+        {
+            "title": MEETING_TITLE,
+            "start": MEETING_START,
+            "end": MEETING_END,
+            "timezone": MEETING_TIMEZONE,
+            "host_email": HOST_EMAIL,
+            "site_url": SITE_URL
+        }
+    ]
+    meetings, failed = create_meetings(access_token, meeting_specs)
+    # Step 3: Display the details of every meeting that was created
+    for meeting_details in meetings:
+        display_meeting_details(meeting_details)
+    if failed:
+        titles = ", ".join(spec["title"] for spec in failed)
+        print(f"\n❌ {len(failed)} meeting(s) could not be created: {titles}\n")
+        sys.exit(1)
     print("\n✓ Script completed successfully!\n")
 
 
@@ -9,17 +9,26 @@ Author: Taylor Hanson, Cisco Collab SE
 Purpose: Teaching tool and example for Webex API integration
 """
 
+import hashlib
+import os
 import sys
 import time
+import random
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util import Retry
 import zipfile
-import io
+import shutil
+import tempfile
 from datetime import datetime, timedelta
 from typing import Dict, Any
 
 # Python dependencies, Install with:
-# pip install requests>=2.31.0
-# Note: zipfile, io, time, datetime are part of Python standard library (no install needed)
+# pip install requests>=2.31.0 urllib3>=1.26 orjson>=3.9.0
+# Note: zipfile, shutil, tempfile, time, random, datetime are part of Python standard library (no install needed)
 
 # ============================================================================
 # CONFIGURATION SECTION - Modify these values as needed
@@ -40,6 +49,179 @@ DAYS_BACK = 30
 SERVICES = ["Webex Meetings"]
 # API Base URL - shouldn't need to change this
 WEBEX_API_BASE = "https://webexapis.com/v1"
+# Access tokens are cached here between runs (keyed by a hash of the credentials) so the script
+# only has to refresh the token when the cached one is about to expire
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "webex_token.json")
+# Access token already obtained by this process (filled in by get_access_token)
+CACHED_TOKEN: Dict[str, Any] = {}
+# Headers shared by every JSON request body (the access token is added per call)
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# First bytes of every ZIP file (the local file header signature)
+ZIP_MAGIC = b'PK\x03\x04'
+# Template fields used by display_templates_and_select()
+TEMPLATE_FIELDS = ("Id", "title", "service", "maxDays")
+# Report fields shown by display_report_details(), with "N/A" for any that are missing
+REPORT_FIELD_DEFAULTS = dict.fromkeys(
+    ("title", "service", "status", "startDate", "endDate", "siteList", "Id", "downloadURL"),
+    "N/A"
+)
+REPORT_DETAILS_TEMPLATE = (
+    "\n" + "=" * 70 + "\n"
+    "REPORT DETAILS\n"
+    + "=" * 70 + "\n"
+    "\nTitle:       {title}\n"
+    "Service:       {service}\n"
+    "Status:        {status}\n"
+    "Date Range:    {startDate} to {endDate}\n"
+    "Site:          {siteList}\n"
+    "Report ID:     {Id}\n"
+    "Download URL:  {downloadURL}\n"
+    "\n" + "=" * 70 + "\n"
+)
+
+
+class WebexRetry(Retry):
+    """
+    Retry policy that never repeats a POST which Webex may already have processed.
+    A 500/502/504 reply to "create meeting" or "create report" can arrive after the
+    object was created, so retrying it could create a duplicate. Those POSTs are
+    only retried when Webex says it didn't process them: 429 (rate limited), or
+    503 with a Retry-After header, or when the connection couldn't be opened.
+    Exchanging the refresh token is safe to repeat, so it gets the full policy.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if (method or "").upper() == "POST" and not (url or "").endswith("/access_token"):
+            if error is not None and not self._is_connection_error(error):
+                # The request may have reached Webex - report the error instead
+                raise error.with_traceback(_stacktrace)
+            if response is not None and not (
+                response.status == 429
+                or (response.status == 503 and response.headers.get("Retry-After"))
+            ):
+                # Hand the response back as-is (see raise_on_status below)
+                raise MaxRetryError(_pool, url, ResponseError(f"not retrying POST after {response.status}"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+# Retry policy for transient failures - Webex rate limits every endpoint (429)
+# and asks clients to wait for the Retry-After header before trying again.
+# Other 5xx errors get exponential backoff (1s, 2s, 4s, ...) before giving up.
+RETRY_POLICY = WebexRetry(
+    total=8,
+    backoff_factor=1.0,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods={"GET", "POST"},  # WebexRetry.increment() limits which POSTs are retried
+    respect_retry_after_header=True,
+    raise_on_status=False  # Hand the last response back so raise_for_status() reports it
+)
+
+# Shared HTTP session - reusing one session keeps the TCP/TLS connection to
+# Webex open between calls instead of doing a fresh handshake for every request
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(max_retries=RETRY_POLICY, pool_connections=10, pool_maxsize=10))
+
+
+def read_cache_file(path: str) -> Dict[str, Any]:
+    """
+    Read a JSON cache file from disk.
+    Args:
+        path: Location of the cache file
+    Returns:
+        Dictionary stored in the cache (empty if there is no cache yet)
+    """
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+
+def write_cache_file(path: str, cache: Dict[str, Any]) -> None:
+    """
+    Write a JSON cache file to disk.
+    The file is only readable by the current user since caches can hold credentials.
+    Args:
+        path: Location of the cache file
+        cache: Dictionary to store in the cache
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Create the file with owner-only permissions, and tighten them on an existing file
+        with open(path, "wb", opener=lambda name, flags: os.open(name, flags, 0o600)) as f:
+            f.write(orjson.dumps(cache))
+        os.chmod(path, 0o600)
+    except OSError as e:
+        # Caching is only an optimization - carry on without it
+        print(f"WARNING: Could not update cache file {path}: {e}")
+
+
+def token_cache_key() -> str:
+    """
+    Build the token cache key from the configured credentials, so changing
+    CLIENT_ID, CLIENT_SECRET or REFRESH_TOKEN (e.g. to act as a different user)
+    never picks up a token cached for the old ones. Only a hash is stored, never
+    the credentials themselves.
+    Returns:
+        Hex SHA-256 digest of the credentials
+    """
+    credentials = "\0".join((CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN))
+    return hashlib.sha256(credentials.encode("utf-8")).hexdigest()
+
+
+def forget_cached_token() -> None:
+    """
+    Drop the access token from both the in-process and the on-disk cache.
+    """
+    CACHED_TOKEN.clear()
+    cache = read_cache_file(TOKEN_CACHE_FILE)
+    if cache.pop(token_cache_key(), None) is not None:
+        write_cache_file(TOKEN_CACHE_FILE, cache)
+
+
+def refresh_token_on_401(response: requests.Response, *args, **kwargs) -> requests.Response:
+    """
+    Session response hook: when Webex rejects an access token (e.g. a cached token
+    that was revoked), get a new one and send the request again once.
+    Args:
+        response: The HTTP response returned by the session
+        kwargs: Send options (stream, timeout, ...) to reuse for the retried request
+    Returns:
+        The original response, or the response to the retried request
+    """
+    rejected = response.request.headers.get("Authorization")
+    # The token exchange itself has no bearer token - a 401 there is a real error
+    if response.status_code != 401 or not rejected:
+        return response
+    print("⚠️  Access token was rejected - requesting a new one...")
+    forget_cached_token()
+    access_token = get_access_token()
+    response.close()
+    request = response.request.copy()
+    request.headers["Authorization"] = f"Bearer {access_token}"
+    # Send through the adapter directly so this hook can't run again for the retry
+    return response.connection.send(request, **kwargs)
+
+
+SESSION.hooks["response"].append(refresh_token_on_401)
+
+
+class CurrentTokenAuth(AuthBase):
+    """
+    Session auth: send every Webex API call with the current access token, so a
+    caller still holding a token that refresh_token_on_401() has since replaced
+    doesn't get a 401 (and a resend) on every following request.
+    """
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        # The token exchange has no bearer token and is left untouched
+        if CACHED_TOKEN and "Authorization" in request.headers:
+            request.headers["Authorization"] = f"Bearer {CACHED_TOKEN['access_token']}"
+        return request
+
+
+SESSION.auth = CurrentTokenAuth()
 
 
 def get_access_token() -> str:
@@ -47,12 +229,24 @@ def get_access_token() -> str:
     Exchange a refresh token for a new access token.
     The access token is temporary and used for API calls during this session.
     OAuth flow: refresh_token -> access_token
+    A token obtained earlier in this process, or cached on disk by a previous run,
+    is reused if it is still valid for at least a minute - so calling this
+    repeatedly (e.g. when the script is imported as a module) is cheap.
     Returns:
         A valid access token string
     Raises:
         SystemExit: If token refresh fails
     """
+    # Token already obtained earlier in this process - nothing to do
+    if CACHED_TOKEN and time.time() < CACHED_TOKEN["expires_at"] - 60:
+        return CACHED_TOKEN["access_token"]
     print("🔐 Authenticating with Webex...")
+    # Reuse the token cached on disk by a previous run if it isn't about to expire
+    cached = read_cache_file(TOKEN_CACHE_FILE).get(token_cache_key())
+    if cached and time.time() < cached.get("expires_at", 0) - 60:
+        CACHED_TOKEN.update(cached)
+        print("✓ Using cached access token\n")
+        return cached["access_token"]
     # Prepare the token request
     url = f"{WEBEX_API_BASE}/access_token"
     headers = {"content-type": "application/x-www-form-urlencoded"}
@@ -64,18 +258,26 @@ def get_access_token() -> str:
     }
     # Make the POST request to get a new access token
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = SESSION.post(url, headers=headers, data=data)
         response.raise_for_status()  # Raise an error for bad status codes (4xx, 5xx)
         # Extract the access token from the response
-        token_data = response.json()
+        token_data = orjson.loads(response.content)
         access_token = token_data.get("access_token")
         if not access_token:
             print("ERROR: No access token in response")
             sys.exit(1)
-            
+        # Cache the token for this process and later runs - Webex access tokens are valid for
+        # 14 days unless the response says otherwise
+        CACHED_TOKEN.update({
+            "access_token": access_token,
+            "expires_at": time.time() + token_data.get("expires_in", 1209600)
+        })
+        cache = read_cache_file(TOKEN_CACHE_FILE)
+        cache[token_cache_key()] = dict(CACHED_TOKEN)
+        write_cache_file(TOKEN_CACHE_FILE, cache)
         print("✓ Authentication successful!\n")
         return access_token
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"ERROR: Failed to get access token: {e}")
         sys.exit(1)
 
@@ -86,7 +288,7 @@ def list_report_templates(access_token: str) -> list:
     Args:
         access_token: Valid Webex access token
     Returns:
-        List of report template dictionaries
+        List of report template dictionaries (limited to TEMPLATE_FIELDS)
     Raises:
         SystemExit: If API call fails
     """
@@ -94,13 +296,18 @@ def list_report_templates(access_token: str) -> list:
     url = f"{WEBEX_API_BASE}/report/templates"
     headers = {"Authorization": f"Bearer {access_token}"}
     try:
-        response = requests.get(url, headers=headers)
+        response = SESSION.get(url, headers=headers)
         response.raise_for_status()
-        data = response.json()
-        templates = data.get("items", [])
+        data = orjson.loads(response.content)
+        # Keep only the fields we display - templates also carry site lists,
+        # field descriptions, etc. that would otherwise stay in memory
+        templates = [
+            {field: template[field] for field in TEMPLATE_FIELDS if field in template}
+            for template in data.get("items", [])
+        ]
         print(f"✓ Found {len(templates)} report templates\n")
-        return templates 
-    except requests.exceptions.RequestException as e:
+        return templates
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"ERROR: Failed to fetch templates: {e}")
         sys.exit(1)
 
@@ -185,10 +392,7 @@ def create_report(access_token: str, template_id: int,
     print(f"   Date Range: {start_date} to {end_date}")
     print(f"   Site: {site_list}")
     url = f"{WEBEX_API_BASE}/reports"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    headers = {**JSON_HEADERS, "Authorization": f"Bearer {access_token}"}
     
     # Prepare the request body
     payload = {
@@ -198,18 +402,18 @@ def create_report(access_token: str, template_id: int,
         "siteList": site_list
     }
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = SESSION.post(url, headers=headers, data=orjson.dumps(payload))
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         report_id = data.get("items", {}).get("Id")
         if not report_id:
             print("ERROR: No report ID in response")
             sys.exit(1)
         print(f"✓ Report created successfully! (ID: {report_id})\n")
         return report_id
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"ERROR: Failed to create report: {e}")
-        if hasattr(e.response, 'text'):
+        if getattr(e, 'response', None) is not None:
             print(f"Response: {e.response.text}")
         sys.exit(1)
 
@@ -229,15 +433,15 @@ def get_report_details(access_token: str, report_id: str) -> Dict[str, Any]:
     url = f"{WEBEX_API_BASE}/reports/{report_id}"
     headers = {"Authorization": f"Bearer {access_token}"}
     try:
-        response = requests.get(url, headers=headers)
+        response = SESSION.get(url, headers=headers)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         items = data.get("items", [])
         if not items:
             print("ERROR: No report details found")
             sys.exit(1)
         return items[0]  # Return the first (and typically only) item
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"ERROR: Failed to fetch report details: {e}")
         sys.exit(1)
 
@@ -248,37 +452,35 @@ def display_report_details(report: Dict[str, Any]) -> None:
     Args:
         report: Dictionary containing report details
     """
-    print("\n" + "=" * 70)
-    print("REPORT DETAILS")
-    print("=" * 70)
-    # Extract and display relevant fields
-    print(f"\nTitle:       {report.get('title', 'N/A')}")
-    print(f"Service:       {report.get('service', 'N/A')}")
-    print(f"Status:        {report.get('status', 'N/A')}")
-    print(f"Date Range:    {report.get('startDate', 'N/A')} to {report.get('endDate', 'N/A')}")
-    print(f"Site:          {report.get('siteList', 'N/A')}")
-    print(f"Report ID:     {report.get('Id', 'N/A')}")
-    print(f"Download URL:  {report.get('downloadURL', 'N/A')}")
-    print("\n" + "=" * 70)
+    # Fill in the template in one go and write it with a single call
+    view = {**REPORT_FIELD_DEFAULTS, **report}
+    sys.stdout.write(REPORT_DETAILS_TEMPLATE.format_map(view))
 
 
-def poll_report_until_ready(access_token: str, report_id: str, poll_interval: int = 5, max_attempts: int = 60) -> Dict[str, Any]:
+def poll_report_until_ready(access_token: str, report_id: str, poll_interval: float = 2,
+                            max_attempts: int = 60, max_interval: float = 30,
+                            timeout: float = 300) -> Dict[str, Any]:
     """
     Poll the report status until it's ready (status = "done").
+    The wait between polls starts short and grows by 1.5x each attempt (capped at
+    max_interval), so small reports are picked up quickly while long-running ones
+    don't burn through the API rate limit with identical requests.
     Args:
         access_token: Valid Webex access token
         report_id: The ID of the report to poll
-        poll_interval: Seconds to wait between polls (default: 5)
+        poll_interval: Seconds to wait after the first poll (default: 2)
         max_attempts: Maximum number of polling attempts (default: 60)
+        max_interval: Longest wait between polls in seconds (default: 30)
+        timeout: Give up after this many seconds (default: 300)
     Returns:
         Dictionary containing the final report details
     Raises:
         SystemExit: If report fails or timeout reached
     """
     print("⏳ Waiting for report to be generated...")
-    attempt = 0
-    while attempt < max_attempts:
-        attempt += 1
+    started = time.monotonic()
+    deadline = started + timeout
+    for attempt in range(1, max_attempts + 1):
         report = get_report_details(access_token, report_id)
         status = report.get("status", "").lower()
         if status == "done":
@@ -287,12 +489,18 @@ def poll_report_until_ready(access_token: str, report_id: str, poll_interval: in
         elif status == "failed":
             print("❌ Report generation failed!")
             sys.exit(1)
-        else:
-            # Still processing - wait and try again
-            print(f"   Status: {status} (attempt {attempt}/{max_attempts})")
-            time.sleep(poll_interval)
+        remaining = deadline - time.monotonic()
+        if attempt == max_attempts or remaining <= 0:
+            break
+        # Still processing - back off exponentially, with +/-10% jitter, but never
+        # sleep past the deadline so there is always one last check right at it
+        delay = min(max_interval, poll_interval * (1.5 ** (attempt - 1)))
+        delay *= 1 + random.uniform(-0.1, 0.1)
+        delay = min(delay, remaining)
+        print(f"   Status: {status} (attempt {attempt}/{max_attempts}, next check in {delay:.0f}s)")
+        time.sleep(delay)
     # Timeout reached
-    print(f"❌ Timeout: Report did not complete after {max_attempts * poll_interval} seconds")
+    print(f"❌ Timeout: Report did not complete after {time.monotonic() - started:.0f} seconds")
     sys.exit(1)
 
 
@@ -313,41 +521,51 @@ def download_report(access_token: str, download_url: str, output_filename: str =
     print(f"📥 Downloading report from: {download_url}")
     headers = {"Authorization": f"Bearer {access_token}"}
     try:
-        response = requests.get(download_url, headers=headers)
-        response.raise_for_status()
-        # Check if the response is a ZIP file
-        content = response.content
-        if content[:4] == b'PK\x03\x04':  # ZIP file magic number
-            print("   Detected ZIP file, extracting CSV...")
-            # Open the ZIP file from memory
-            with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
-                # Get list of files in the ZIP
-                file_list = zip_file.namelist()
-                # Find the first CSV file
-                csv_file = next((f for f in file_list if f.endswith('.csv')), None)
-                if csv_file:
-                    # Extract the CSV content
-                    csv_content = zip_file.read(csv_file)
-                    # Generate output filename if not provided
-                    if not output_filename:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        output_filename = f"webex_report_{timestamp}.csv"
-                    # Write the CSV to a file
-                    with open(output_filename, 'wb') as f:
-                        f.write(csv_content)
-                    print(f"✓ Report downloaded and extracted: {output_filename}\n")
-                    return output_filename
-                else:
-                    print("ERROR: No CSV file found in ZIP archive")
-                    sys.exit(1)
-        else:
-            # Not a ZIP file, save as-is
+        # Stream the body straight into a temporary file instead of holding the
+        # whole report in memory - meeting history exports can be very large
+        with SESSION.get(download_url, headers=headers, stream=True) as response, \
+                tempfile.TemporaryFile() as tmp:
+            response.raise_for_status()
+            # iter_content undoes any gzip encoding and reports a dropped or
+            # truncated download as a RequestException
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                tmp.write(chunk)
+            # Generate output filename if not provided
             if not output_filename:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 output_filename = f"webex_report_{timestamp}.csv"
-            with open(output_filename, 'wb') as f:
-                f.write(content)
-            print(f"✓ Report downloaded: {output_filename}\n")
+            # Check if the download is a ZIP file
+            tmp.seek(0)
+            if tmp.read(len(ZIP_MAGIC)).startswith(ZIP_MAGIC):
+                print("   Detected ZIP file, extracting CSV...")
+                # Open the ZIP file from the temporary file on disk
+                with zipfile.ZipFile(tmp) as zip_file:
+                    # Get list of files in the ZIP
+                    file_list = zip_file.namelist()
+                    # Find the first CSV file
+                    csv_file = next((f for f in file_list if f.endswith('.csv')), None)
+                    if not csv_file:
+                        print("ERROR: No CSV file found in ZIP archive")
+                        sys.exit(1)
+                    # Extract the CSV to a file in chunks, without decompressing it all into memory.
+                    # It goes to a ".part" file first so a corrupt archive (e.g. a CRC error
+                    # found halfway through) never leaves a truncated CSV under the real name
+                    partial_filename = f"{output_filename}.part"
+                    try:
+                        with zip_file.open(csv_file) as src, open(partial_filename, 'wb') as f:
+                            shutil.copyfileobj(src, f, length=1024 * 1024)
+                    except BaseException:
+                        if os.path.exists(partial_filename):
+                            os.remove(partial_filename)
+                        raise
+                    os.replace(partial_filename, output_filename)
+                print(f"✓ Report downloaded and extracted: {output_filename}\n")
+            else:
+                # Not a ZIP file, save as-is
+                tmp.seek(0)
+                with open(output_filename, 'wb') as f:
+                    shutil.copyfileobj(tmp, f, length=1024 * 1024)
+                print(f"✓ Report downloaded: {output_filename}\n")
             return output_filename
     except requests.exceptions.RequestException as e:
         print(f"ERROR: Failed to download report: {e}")